@@ -239,6 +239,12 @@ try {
         & $VenvPip install -r "$PatcherReqs" --quiet
     }
 
+    Write-Host "Installing redirector requirements..." -ForegroundColor Yellow
+    $RedirectorReqs = Join-Path $SrcWrapperDir "requirements.txt"
+    if (Test-Path $RedirectorReqs) {
+        & $VenvPip install -r "$RedirectorReqs" --quiet
+    }
+
     Write-Host "Dependencies installed (PyInstaller bootloader recompiled)."
 
     Write-Host "[3/6] Starting build process..." -ForegroundColor Green
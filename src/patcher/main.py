@@ -367,6 +367,9 @@ def load_config(config_path):
         "enable_tier3_native": True,
         "enable_tier4_recovery": True,
         "failure_retry_window": 60,
+        "tier1_grace_ms": 2500,
+        "tier2_grace_ms": 8000,
+        "trust_direct_video_url": True,
         "video_error_patterns": [
             "Video Error: Error (3): Video player error: Source not supported",
             "Video Error: Error (3): Video player error: Failed to resolve URL",
@@ -384,7 +387,7 @@ def load_config(config_path):
     if not config_exists:
         try:
             with open(config_path, 'w', encoding='utf-8') as f:
-                json.dump(defaults, f, indent=4)
+                f.write(json.dumps(defaults, indent=4))
         except: pass
         return defaults
 
@@ -392,23 +395,25 @@ def load_config(config_path):
         with open(config_path, 'r', encoding='utf-8-sig') as f:
             user_config = json.load(f)
             
-            # Diagnostic: Log non-default settings
-            overrides = []
-            for k, v in defaults.items():
-                if k in user_config and user_config[k] != v:
-                    overrides.append(f"{k}={user_config[k]}")
-                if k not in user_config: user_config[k] = v
+            if not isinstance(user_config, dict): return defaults
             
+            # Diagnostic: Log non-default settings
+            overrides = [f"{k}={user_config[k]}" for k, v in defaults.items() if k in user_config and user_config[k] != v]
             if overrides:
                 logger.info(f"[System] Config Overrides: {', '.join(overrides)}")
             
-            return user_config
+            merged = {**defaults, **user_config}
+            if len(merged) != len(user_config):
+                # Write newly added settings back once so they show up in the user's file
+                try:
+                    with open(config_path, 'w', encoding='utf-8') as f:
+                        f.write(json.dumps(merged, indent=4))
+                except: pass
+            return merged
     except:
         return defaults
 
-def get_vrchat_log_dir():
-    config_path = os.path.join(APP_BASE_PATH, CONFIG_FILE_NAME)
-    cfg = load_config(config_path)
+def get_vrchat_log_dir(cfg):
     log_dir = cfg.get('vrchat_log_dir')
     if log_dir and os.path.exists(log_dir): return log_dir
     default = os.path.join(os.path.expanduser('~'), 'AppData', 'LocalLow', 'VRChat', 'VRChat')
@@ -555,7 +560,7 @@ def disable_patch(file_list):
                     if os.path.isdir(path): shutil.rmtree(path, ignore_errors=True)
                     else: os.remove(path)
                 except: pass
-        cleanup_targets = [WRAPPER_STATE_PATH, REDIRECTOR_LOG_PATH, ORIGINAL_YTDLP_BACKUP_PATH]
+        cleanup_targets = [WRAPPER_STATE_PATH, REDIRECTOR_LOG_PATH, REDIRECTOR_LOG_PATH + '.1', ORIGINAL_YTDLP_BACKUP_PATH]
         for target in cleanup_targets:
             if target and os.path.exists(target):
                 try: os.remove(target)
@@ -576,7 +581,7 @@ def main():
             time.sleep(3); sys.exit(1)
 
     CONFIG = load_config(os.path.join(APP_BASE_PATH, CONFIG_FILE_NAME))
-    VRCHAT_LOG_DIR = get_vrchat_log_dir()
+    VRCHAT_LOG_DIR = get_vrchat_log_dir(CONFIG)
     if not VRCHAT_LOG_DIR:
         print("VRChat log directory not found!")
         time.sleep(5); sys.exit(1)
@@ -609,7 +614,7 @@ def main():
 
             try:
                 if os.path.exists(WRAPPER_STATE_PATH):
-                    with open(WRAPPER_STATE_PATH, 'r') as f:
+                    with open(WRAPPER_STATE_PATH, 'r', encoding='utf-8') as f:
                         s = json.load(f)
                         new_engine = s.get('active_player', 'unknown')
                         if ui_state.engine != new_engine:
@@ -14,7 +14,7 @@ def update_wrapper_state(state_path, active_player=None):
         state = {'active_player': 'unknown', 'history': []}
         if os.path.exists(state_path):
             try:
-                with open(state_path, 'r') as f:
+                with open(state_path, 'r', encoding='utf-8') as f:
                     state = json.load(f)
             except Exception: pass
         
@@ -31,7 +31,16 @@ def update_wrapper_state(state_path, active_player=None):
         now = time.time()
         state['history'] = [h for h in state.get('history', []) if (now - h[3] < 3600)]
 
-        with open(state_path, 'w') as f:
-            json.dump(state, f)
+        # One write of the whole document, then an atomic swap so the Redirector never reads it half-written
+        # The temp name carries the pid so it never collides with a Redirector writing the same file
+        tmp_path = f"{state_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(state, separators=(',', ':')))
+            os.replace(tmp_path, state_path)
+        except Exception:
+            try: os.remove(tmp_path)
+            except OSError: pass
+            raise
     except Exception as e:
         logger.error(f"Failed to update wrapper state: {e}")
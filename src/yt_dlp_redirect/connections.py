@@ -0,0 +1,184 @@
+import base64
+import http.client
+import socket
+import ssl
+import threading
+import logging
+import urllib.request
+from urllib.parse import urlsplit, urljoin, unquote
+
+logger = logging.getLogger("Connections")
+
+# Global context for SSL to avoid some certificate issues. Built directly rather than via
+# create_default_context(), which loads the whole system CA store that CERT_NONE never consults.
+ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+ssl_context.check_hostname = False
+ssl_context.verify_mode = ssl.CERT_NONE
+
+# Errors that mean a kept-alive socket was closed by the server between requests.
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest, ConnectionResetError, BrokenPipeError)
+# Errors that mean the host is down or unresolvable, unlike a timeout which a later attempt might outlast.
+UNREACHABLE_ERRORS = (ConnectionRefusedError, socket.gaierror)
+
+class ConnectionPool:
+    """
+    Keeps one idle keep-alive connection per host so repeated calls skip the TCP + TLS handshake.
+    Honours the system proxy settings the way urlopen does.
+    """
+    def __init__(self):
+        self.idle = {}
+        self.addresses = {}
+        self.routes = {}
+        self.proxies = None
+        self.lock = threading.Lock()
+
+    def _route(self, scheme, netloc):
+        """
+        Returns (proxy host:port, Proxy-Authorization header or None) for this origin, or None to connect directly.
+        Uses the same system settings urlopen does: the *_proxy environment variables, or the Windows registry.
+        """
+        with self.lock:
+            if (scheme, netloc) in self.routes: return self.routes[(scheme, netloc)]
+            if self.proxies is None: self.proxies = urllib.request.getproxies()
+            proxy = self.proxies.get(scheme)
+        route = None
+        if proxy and not urllib.request.proxy_bypass(netloc):
+            parts = urlsplit(proxy if '://' in proxy else 'http://' + proxy)
+            auth = None
+            if parts.username is not None:
+                credentials = f"{unquote(parts.username)}:{unquote(parts.password or '')}"
+                auth = 'Basic ' + base64.b64encode(credentials.encode()).decode('ascii')
+            route = (parts.netloc.rsplit('@', 1)[-1], auth)
+        with self.lock:
+            self.routes[(scheme, netloc)] = route
+        return route
+
+    def _create_connection(self, address, timeout, source_address=None):
+        """
+        Resolves each (host, port) once per invocation; reconnects reuse the cached addresses.
+        Like socket.create_connection, every address is tried in turn. TLS still uses the hostname for SNI.
+        """
+        with self.lock:
+            addresses = self.addresses.get(address)
+        if addresses is None:
+            addresses = socket.getaddrinfo(address[0], address[1], type=socket.SOCK_STREAM)
+            with self.lock:
+                self.addresses[address] = addresses
+        error = None
+        for family, socktype, proto, _, sockaddr in addresses:
+            sock = socket.socket(family, socktype, proto)
+            try:
+                if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT: sock.settimeout(timeout)
+                if source_address: sock.bind(source_address)
+                sock.connect(sockaddr)
+                return sock
+            except OSError as e:
+                sock.close(); error = e
+        raise error
+
+    def _checkout(self, scheme, netloc, timeout):
+        """timeout is seconds, or a (connect, read) pair so a dead host fails fast while slow responses still get time."""
+        connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        with self.lock:
+            conn = self.idle.pop((scheme, netloc), None)
+        if conn:
+            conn.timeout = read_timeout
+            if conn.sock: conn.sock.settimeout(read_timeout)
+            return conn, True
+        route = self._route(scheme, netloc)
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(route[0] if route else netloc, timeout=connect_timeout, context=ssl_context)
+            # CONNECT through the proxy; TLS (and SNI) is then negotiated with the origin inside the tunnel
+            if route: conn.set_tunnel(netloc, headers={'Proxy-Authorization': route[1]} if route[1] else None)
+        else:
+            conn = http.client.HTTPConnection(route[0] if route else netloc, timeout=connect_timeout)
+        conn._create_connection = self._create_connection
+        if read_timeout != connect_timeout:
+            # Connect (and TLS handshake) under the connect timeout, then switch the socket to the read timeout
+            try: conn.connect()
+            except Exception:
+                conn.close(); raise
+            conn.timeout = read_timeout
+            conn.sock.settimeout(read_timeout)
+        return conn, False
+
+    def _checkin(self, scheme, netloc, conn):
+        with self.lock:
+            old = self.idle.pop((scheme, netloc), None)
+            self.idle[(scheme, netloc)] = conn
+        if old: old.close()
+
+    def prewarm(self, base_url, timeout=3.0):
+        """
+        Opens a connection ahead of the first request.
+        Returns True once connected, False if the host refused or did not resolve, and None for other failures such as timeouts.
+        """
+        parts = urlsplit(base_url)
+        conn, reused = self._checkout(parts.scheme, parts.netloc, timeout)
+        if not reused:
+            try: conn.connect()
+            except UNREACHABLE_ERRORS as e:
+                conn.close()
+                logger.debug("Prewarm of %s failed: %s", parts.netloc, e)
+                return False
+            except Exception as e:
+                conn.close()
+                logger.debug("Prewarm of %s did not complete: %s", parts.netloc, e)
+                return None
+        self._checkin(parts.scheme, parts.netloc, conn)
+        return True
+
+    def request(self, method, url, headers=None, timeout=10.0, max_bytes=None, max_redirects=5):
+        """
+        Returns (status, response_headers, body_bytes), following redirects like urllib does.
+        timeout may be a (connect, read) pair. With max_bytes only the start of the body is read and the connection is not reused.
+        """
+        for _ in range(max_redirects + 1):
+            parts = urlsplit(url)
+            path = parts.path or '/'
+            if parts.query: path += '?' + parts.query
+            request_headers = headers or {}
+            route = self._route(parts.scheme, parts.netloc) if parts.scheme == 'http' else None
+            if route:
+                # A plain HTTP proxy takes the absolute URL instead of a CONNECT tunnel
+                path = f"http://{parts.netloc}{path}"
+                if route[1]: request_headers = dict(request_headers, **{'Proxy-Authorization': route[1]})
+
+            conn, reused = self._checkout(parts.scheme, parts.netloc, timeout)
+            try:
+                conn.request(method, path, headers=request_headers)
+                resp = conn.getresponse()
+            except STALE_CONNECTION_ERRORS:
+                conn.close()
+                if not reused: raise
+                logger.debug("Stale connection to %s, reconnecting.", parts.netloc)
+                conn, _ = self._checkout(parts.scheme, parts.netloc, timeout)
+                conn.request(method, path, headers=request_headers)
+                resp = conn.getresponse()
+            except Exception:
+                conn.close(); raise
+
+            try: body = resp.read(max_bytes) if max_bytes else resp.read()
+            except Exception:
+                conn.close(); raise
+
+            # A partially read body leaves the socket mid-response, so it cannot carry another request
+            if resp.will_close or not resp.isclosed(): conn.close()
+            else: self._checkin(parts.scheme, parts.netloc, conn)
+
+            location = resp.getheader('Location')
+            if resp.status in (301, 302, 303, 307, 308) and location:
+                url = urljoin(url, location)
+                if resp.status == 303: method = 'GET'
+                continue
+            return resp.status, resp.msg, body
+        raise http.client.HTTPException(f"Too many redirects for {url}")
+
+    def close(self):
+        with self.lock:
+            conns = list(self.idle.values()); self.idle.clear()
+        for conn in conns:
+            try: conn.close()
+            except Exception: pass
+
+connection_pool = ConnectionPool()
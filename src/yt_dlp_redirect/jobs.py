@@ -1,34 +1,68 @@
 import ctypes
-import platform
+import os
 import struct
+import subprocess
+import threading
 import logging
 
 logger = logging.getLogger("JobManager")
 
+# Evaluated once; os.name avoids platform.system()'s uname/registry lookup
+IS_WINDOWS = os.name == 'nt'
+CREATION_FLAGS = subprocess.CREATE_NO_WINDOW if IS_WINDOWS else 0
+
 class JobManager:
     def __init__(self):
         self.job_handle = None
-        if platform.system() == 'Windows':
+        # pid -> job handle holding just that process tree, so a timeout can kill it without touching siblings
+        self.process_jobs = {}
+        self.lock = threading.Lock()
+        if IS_WINDOWS:
             try:
-                self.job_handle = ctypes.windll.kernel32.CreateJobObjectW(None, None)
-                info = ctypes.create_string_buffer(1024)
-                ctypes.memset(info, 0, 1024)
-                # 0x2000 = JOB_OBJECT_LIMIT_KILL_ON_JOB_CLOSE
-                struct.pack_into("Q", info, 16, 0x2000) 
-                # 9 = JobObjectExtendedLimitInformation
-                ctypes.windll.kernel32.SetInformationJobObject(self.job_handle, 9, info, 144)
+                self.job_handle = self._create_job()
             except Exception as e:
-                logger.debug(f"Failed to initialize Job Object: {e}")
+                logger.debug("Failed to initialize Job Object: %s", e)
                 self.job_handle = None
 
+    def _create_job(self):
+        job_handle = ctypes.windll.kernel32.CreateJobObjectW(None, None)
+        info = ctypes.create_string_buffer(1024)
+        ctypes.memset(info, 0, 1024)
+        # 0x2000 = JOB_OBJECT_LIMIT_KILL_ON_JOB_CLOSE
+        struct.pack_into("Q", info, 16, 0x2000) 
+        # 9 = JobObjectExtendedLimitInformation
+        ctypes.windll.kernel32.SetInformationJobObject(job_handle, 9, info, 144)
+        return job_handle
+
     def assign(self, process):
         if self.job_handle and process:
             try:
                 # process._handle is the process handle in Python subprocess
                 ctypes.windll.kernel32.AssignProcessToJobObject(self.job_handle, int(process._handle))
+                # Nested per-process job (Windows 8+); kill_tree falls back to process.kill() without it
+                process_job = self._create_job()
+                if ctypes.windll.kernel32.AssignProcessToJobObject(process_job, int(process._handle)):
+                    with self.lock: self.process_jobs[process.pid] = process_job
+                else: ctypes.windll.kernel32.CloseHandle(process_job)
+            except Exception: pass
+
+    def kill_tree(self, process):
+        """Kills a timed-out process and everything it spawned (e.g. the onefile bootloader's child)."""
+        with self.lock: process_job = self.process_jobs.pop(process.pid, None)
+        if process_job:
+            try:
+                ctypes.windll.kernel32.TerminateJobObject(process_job, 1)
+                ctypes.windll.kernel32.CloseHandle(process_job)
             except Exception: pass
+        try: process.kill()
+        except Exception: pass
 
     def close(self):
+        with self.lock:
+            process_jobs = list(self.process_jobs.values()); self.process_jobs.clear()
+        for process_job in process_jobs:
+            try: ctypes.windll.kernel32.CloseHandle(process_job)
+            except Exception: pass
         if self.job_handle:
             try:
                 ctypes.windll.kernel32.CloseHandle(self.job_handle)
@@ -0,0 +1,14 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def json_loads(data):
+    """Parses JSON from bytes (or str) with orjson when bundled, stdlib otherwise."""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def json_dumps(obj):
+    """Serializes to compact UTF-8 bytes; the stdlib fallback emits the same non-ASCII bytes as orjson."""
+    return orjson.dumps(obj) if orjson else json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
@@ -13,19 +13,22 @@ if APP_BASE_PATH not in sys.path:
 import logging
 import re
 import threading
-import json
 import time
 import subprocess
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Future, wait, FIRST_COMPLETED
 
 try:
-    from jobs import job_manager
+    from jobs import job_manager, CREATION_FLAGS
+    from connections import connection_pool
+    from json_codec import json_loads, json_dumps
     from verifier import verify_stream, verify_stream_with_ytdlp
-    from resolver import resolve_tier_1_proxy, resolve_tier_2_modern, resolve_tier_3_native, attempt_executable
+    from resolver import resolve_tier_1_proxy, resolve_tier_2_modern, resolve_tier_3_native, attempt_executable, proxy_retry_is_futile, build_modern_formats
 except ImportError:
-    from .jobs import job_manager
+    from .jobs import job_manager, CREATION_FLAGS
+    from .connections import connection_pool
+    from .json_codec import json_loads, json_dumps
     from .verifier import verify_stream, verify_stream_with_ytdlp
-    from .resolver import resolve_tier_1_proxy, resolve_tier_2_modern, resolve_tier_3_native, attempt_executable
+    from .resolver import resolve_tier_1_proxy, resolve_tier_2_modern, resolve_tier_3_native, attempt_executable, proxy_retry_is_futile, build_modern_formats
 
 try:
     from _version import __version__ as WRAPPER_VERSION
@@ -41,17 +44,30 @@ CONFIG_FILE_NAME = "patcher_config.json"
 WRAPPER_STATE_NAME = "wrapper_state.json"
 ORIGINAL_YTDLP_FILENAME = "yt-dlp-og.exe"
 LATEST_YTDLP_FILENAME = "yt-dlp-latest.exe"
+DENO_FILENAME = "deno.exe"
 
 ORIGINAL_YTDLP_PATH = os.path.join(APP_BASE_PATH, ORIGINAL_YTDLP_FILENAME)
 LATEST_YTDLP_PATH = os.path.join(APP_BASE_PATH, LATEST_YTDLP_FILENAME)
+DENO_PATH = os.path.join(APP_BASE_PATH, DENO_FILENAME)
 CONFIG_PATH = os.path.join(APP_BASE_PATH, CONFIG_FILE_NAME)
 WRAPPER_STATE_PATH = os.path.join(APP_BASE_PATH, WRAPPER_STATE_NAME)
+LEGACY_UA_MARKERS = ("UnityPlayer", "NSPlayer", "WMFSDK")
+LEGACY_STATE_KEYS = ('consecutive_errors', 'force_fallback', 'failed_urls', 'domain_blacklist', 'cache')
+DIRECT_VIDEO_EXTENSIONS = ('.mp4', '.webm', '.m4a', '.mkv', '.mov')
+URL_PATTERN = re.compile(r'https?://[^\s<>"+]+|www\.[^\s<>"+]+')
+# How long a failed proxy probe is trusted by later invocations (seconds)
+PROXY_DOWN_TTL = 10.0
+STATE_CACHE = None
+PRESENT_BINARIES = set()
 
 DEFAULT_CONFIG = {
     "remote_server_base": "https://whyknot.dev",
     "domain_branch": "stable", # 'stable' or 'test'
     "preferred_max_height": 1080,
     "failure_retry_window": 60,
+    "tier1_grace_ms": 2500,
+    "tier2_grace_ms": 8000,
+    "trust_direct_video_url": True,
     "custom_user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
     "enable_tier1_proxy": True,
     "enable_tier2_modern": True,
@@ -66,10 +82,12 @@ CONFIG = None
 
 def setup_logging(debug_mode):
     log_file = os.path.join(APP_BASE_PATH, LOG_FILE_NAME)
-    if os.path.exists(log_file) and os.path.getsize(log_file) > 10 * 1024 * 1024:
-        try: os.remove(log_file)
-        except: pass
-    
+    # Size-checked once at startup rather than on every emit: other redirectors and the Patcher's
+    # tail loop keep the file open, so a rename can fail on Windows and we just keep appending.
+    try:
+        if os.stat(log_file).st_size > 10 * 1024 * 1024: os.replace(log_file, log_file + '.1')
+    except OSError: pass
+
     level = logging.DEBUG if debug_mode else logging.INFO
     
     # Use 'a' (append) because redirector is called many times per session.
@@ -77,35 +95,48 @@ def setup_logging(debug_mode):
     logging.basicConfig(
         level=level,
         format='%(asctime)s [%(levelname)s] [%(name)s] %(message)s',
-        handlers=[logging.FileHandler(log_file, mode='a', encoding='utf-8')]
+        # delay=True: the file is only opened on the first emitted record
+        handlers=[logging.FileHandler(log_file, mode='a', encoding='utf-8', delay=True)]
     )
     
     l = logging.getLogger(WRAPPER_NAME)
     l.setLevel(level)
     return l
 
+def is_legacy_user_agent(ua):
+    return any(x in (ua or "") for x in LEGACY_UA_MARKERS)
+
+def finalize_config(config):
+    """Precomputes per-config derived values once, so the resolve path only does lookups."""
+    config["_is_legacy_ua"] = is_legacy_user_agent(config.get("custom_user_agent"))
+    config["_tier2_format_legacy"], config["_tier2_format_modern"] = build_modern_formats(config.get("preferred_max_height", 1080))
+    return config
+
 def load_config():
-    if os.path.exists(CONFIG_PATH):
+    try:
+        with open(CONFIG_PATH, 'rb') as f:
+            user_config = json_loads(f.read())
+        if not isinstance(user_config, dict): raise ValueError("config is not an object")
+        mapping = {"enable_tier1_modern": "enable_tier2_modern", "enable_tier2_proxy": "enable_tier1_proxy"}
+        for old, new in mapping.items():
+            if old in user_config and new not in user_config: user_config[new] = user_config[old]
+        
+        config = {**DEFAULT_CONFIG, **user_config}
+        overrides = [f"{k}={user_config[k]}" for k, v in DEFAULT_CONFIG.items() if k in user_config and user_config[k] != v]
+        if overrides:
+            # Global logger may not be initialized yet, so we return it to be logged after init
+            config["_overrides"] = overrides
+        
+        return finalize_config(config)
+    except Exception: pass
+    return finalize_config(dict(DEFAULT_CONFIG))
+
+def warmup_executables():
+    """Stats the bundled binaries once at startup so the first spawn hits a warm file cache. Records which exist."""
+    for path in (LATEST_YTDLP_PATH, ORIGINAL_YTDLP_PATH, DENO_PATH):
         try:
-            with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-                user_config = json.load(f)
-                mapping = {"enable_tier1_modern": "enable_tier2_modern", "enable_tier2_proxy": "enable_tier1_proxy"}
-                for old, new in mapping.items():
-                    if old in user_config and new not in user_config: user_config[new] = user_config[old]
-                
-                overrides = []
-                for k, v in DEFAULT_CONFIG.items():
-                    if k in user_config and user_config[k] != v:
-                        overrides.append(f"{k}={user_config[k]}")
-                    if k not in user_config: user_config[k] = v
-                
-                if overrides:
-                    # Global logger may not be initialized yet, so we return it to be logged after init
-                    user_config["_overrides"] = overrides
-                    
-                return user_config
-        except: pass
-    return DEFAULT_CONFIG
+            os.stat(path); PRESENT_BINARIES.add(path)
+        except OSError: pass
 
 def safe_print(msg):
     try:
@@ -114,62 +145,145 @@ def safe_print(msg):
     except: pass
 
 def find_url_in_args(args):
-    url_pattern = re.compile(r'https?://[^\s<>"+]+|www\.[^\s<>"+]+')
     for arg in args:
-        match = url_pattern.search(arg)
+        if 'http' not in arg and 'www.' not in arg: continue
+        match = URL_PATTERN.search(arg)
         if match: return match.group(0)
     return None
 
-def detect_legacy(incoming_args, custom_ua):
+def is_direct_video_url(url):
+    """True for a plain media file URL (not a manifest or an API endpoint), judged by its path extension."""
+    return url.split('?', 1)[0].split('#', 1)[0].lower().endswith(DIRECT_VIDEO_EXTENSIONS)
+
+def validate_wrapper_state(state):
+    """
+    Returns the state if it has the shape the lookups expect, with malformed history entries and proxy_down dropped.
+    Returns None for anything else, so a damaged file falls through to resolving instead of aborting the run.
+    """
+    if not isinstance(state, dict) or not isinstance(state.get('history', []), list): return None
+    state['history'] = [h for h in state.get('history', []) if isinstance(h, list) and len(h) == 4 and isinstance(h[3], (int, float))]
+    down = state.get('proxy_down')
+    if down is not None and not (isinstance(down, list) and len(down) == 2 and isinstance(down[1], (int, float))):
+        del state['proxy_down']
+    return state
+
+def read_wrapper_state():
+    """Parses the state file, reusing the last parse while its mtime and size are unchanged."""
+    global STATE_CACHE
     try:
-        if os.path.exists(WRAPPER_STATE_PATH):
-            with open(WRAPPER_STATE_PATH, 'r') as f:
-                state = json.load(f)
-                if state.get('active_player') == 'unity': return True
-                if state.get('active_player') == 'avpro': return False
-    except: pass
-    ua_in_args = next((incoming_args[i+1] for i, a in enumerate(incoming_args) if a == "--user-agent" and i+1 < len(incoming_args)), None)
-    eff_ua = ua_in_args or custom_ua
-    if any(x in (eff_ua or "") for x in ["UnityPlayer", "NSPlayer", "WMFSDK"]): return True
-    if any("protocol^=http" in a or "protocol!*=m3u8" in a for a in incoming_args): return True
-    return False
+        st = os.stat(WRAPPER_STATE_PATH)
+        key = (st.st_mtime_ns, st.st_size)
+        if STATE_CACHE is None or STATE_CACHE[0] != key:
+            with open(WRAPPER_STATE_PATH, 'rb') as f: STATE_CACHE = (key, validate_wrapper_state(json_loads(f.read())))
+        if STATE_CACHE[1] is None:
+            logger.debug("Wrapper state has an unexpected shape, ignoring it.")
+            return None
+        # Callers replace keys on the dict they get back, so hand out a copy
+        return dict(STATE_CACHE[1])
+    except FileNotFoundError: pass
+    except (OSError, ValueError) as e: logger.debug("Could not read wrapper state: %s", e)
+    return None
+
+def detect_legacy(incoming_args, state):
+    if state:
+        if state.get('active_player') == 'unity': return True
+        if state.get('active_player') == 'avpro': return False
+    # One pass picks up both the --user-agent value and any HTTP-only format filter
+    ua_in_args = None; http_only = False; prev = None
+    for a in incoming_args:
+        if ua_in_args is None and prev == "--user-agent": ua_in_args = a
+        elif ua_in_args is None and a.startswith("--user-agent="): ua_in_args = a[13:]
+        elif not http_only and ("protocol^=http" in a or "protocol!*=m3u8" in a): http_only = True
+        prev = a
+    # The configured UA was already classified once in load_config
+    legacy_ua = is_legacy_user_agent(ua_in_args) if ua_in_args else CONFIG.get("_is_legacy_ua")
+    return bool(legacy_ua) or http_only
+
+def write_wrapper_state(state):
+    """Writes the state file via tempfile + rename so the Patcher never reads a partial file."""
+    # Per-process temp name: concurrent invocations and the Patcher must not share one temp file
+    tmp_path = f"{WRAPPER_STATE_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f: f.write(json_dumps(state))
+        os.replace(tmp_path, WRAPPER_STATE_PATH)
+    except Exception:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+def history_is_current(state, target_url, resolved_url, tier):
+    """True if the newest entry already records this result and is still inside the 1h cache window."""
+    if any(k in state for k in LEGACY_STATE_KEYS): return False
+    history = state.get('history') or []
+    # An expired entry still needs its timestamp refreshed, or the URL misses the cache on every later run
+    return bool(history) and history[0][:3] == [target_url, resolved_url, tier] and time.time() - history[0][3] < 3600
 
-def update_wrapper_success(target_url, resolved_url, tier):
+def update_wrapper_success(target_url, resolved_url, tier, cached_state=None):
     try:
-        if os.path.exists(WRAPPER_STATE_PATH):
-            with open(WRAPPER_STATE_PATH, 'r') as f: state = json.load(f)
+        # The snapshot read at startup is enough to tell if a write is needed at all
+        if cached_state is not None and history_is_current(cached_state, target_url, resolved_url, tier):
+            logger.debug("History already up to date. Skipping state write.")
+            return
+        # Re-read before writing so an active_player update from the Patcher is not clobbered
+        state = read_wrapper_state()
+        if state is not None:
             if 'history' not in state: state['history'] = []
+            if history_is_current(state, target_url, resolved_url, tier):
+                logger.debug("History already up to date. Skipping state write.")
+                return
+            legacy_keys = [k for k in LEGACY_STATE_KEYS if k in state]
             state['history'] = [h for h in state['history'] if h[0] != target_url]
             state['history'].insert(0, [target_url, resolved_url, tier, time.time()])
             state['history'] = state['history'][:3]
             # Prune legacy fields
-            for key in ['consecutive_errors', 'force_fallback', 'failed_urls', 'domain_blacklist', 'cache']:
-                if key in state: del state[key]
-            with open(WRAPPER_STATE_PATH, 'w') as f: json.dump(state, f)
-            logger.debug(f"History updated with Tier {tier} result.")
-    except Exception as e: logger.debug(f"Failed to update history: {e}")
+            for key in legacy_keys: del state[key]
+            write_wrapper_state(state)
+            logger.debug("History updated with Tier %s result.", tier)
+    except Exception as e: logger.debug("Failed to update history: %s", e)
+
+def proxy_known_down(state, remote_base):
+    """True while a recent invocation's refused or unresolvable probe of this proxy is still fresh."""
+    down = state.get('proxy_down') if state else None
+    return bool(down) and down[0] == remote_base and time.time() < down[1]
+
+def remember_proxy_down(remote_base):
+    """Lets back-to-back invocations skip a proxy that just refused or failed to resolve. Timeouts are not recorded."""
+    try:
+        state = read_wrapper_state()
+        if state is not None:
+            state['proxy_down'] = [remote_base, time.time() + PROXY_DOWN_TTL]
+            write_wrapper_state(state)
+    except Exception as e: logger.debug("Failed to record proxy status: %s", e)
+
+def forget_history(target_url):
+    try:
+        state = read_wrapper_state()
+        if state is not None and any(h[0] == target_url for h in state.get('history', [])):
+            state['history'] = [h for h in state['history'] if h[0] != target_url]
+            write_wrapper_state(state)
+    except Exception as e: logger.debug("Failed to purge history: %s", e)
 
-def get_cached_result(target_url):
+def get_cached_result(target_url, state):
     try:
-        if os.path.exists(WRAPPER_STATE_PATH):
-            with open(WRAPPER_STATE_PATH, 'r') as f: state = json.load(f)
+        if state is not None:
             history = state.get('history', [])
             for target, resolved, tier, ts in history:
                 if target == target_url and (time.time() - ts < 3600): # 1h cache
                     logger.info(f"History Hit! Using verified Tier {tier} URL.")
                     if verify_stream(resolved, timeout=4.0): return resolved
                     else:
+                        # Dropped in memory only; a successful tier overwrites the entry in its own write,
+                        # and forget_history persists the purge if every tier fails
                         logger.warning("History item invalid. Purging.")
                         state['history'] = [h for h in history if h[1] != resolved]
-                        with open(WRAPPER_STATE_PATH, 'w') as wf: json.dump(state, wf)
-    except: pass
+    except (OSError, ValueError, TypeError) as e: logger.debug("History lookup failed: %s", e)
     return None
 
 def list_formats_background(ytdlp_path, name, target_url):
     """Executes -F in the background and logs the output."""
     def task():
         try:
-            logger.debug(f"[{name}] Starting background format listing for: {target_url[:50]}...")
+            logger.debug("[%s] Starting background format listing for: %s...", name, target_url[:50])
             cmd = [ytdlp_path, "--no-warnings", "--ignore-errors", "-F", target_url]
             # Use minimal flags for OG
             if "og" in ytdlp_path.lower():
@@ -177,16 +291,38 @@ def list_formats_background(ytdlp_path, name, target_url):
                 
             proc = subprocess.Popen(
                 cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
-                creationflags=subprocess.CREATE_NO_WINDOW
+                creationflags=CREATION_FLAGS
             )
             job_manager.assign(proc)
             stdout, _ = proc.communicate(timeout=30.0)
             if stdout:
-                logger.debug(f"[{name}] Available Formats:\n{stdout}")
+                logger.debug("[%s] Available Formats:\n%s", name, stdout)
+        except Exception as e:
+            logger.debug("[%s] Background format listing failed: %s", name, e)
+
+    threading.Thread(target=task, daemon=True).start()
+
+def run_in_background(fn):
+    """Runs fn on a daemon thread so an abandoned tier never holds up process exit."""
+    future = Future()
+    def task():
+        try: future.set_result(fn())
         except Exception as e:
-            logger.debug(f"[{name}] Background format listing failed: {e}")
+            logger.debug("Background task failed: %s", e)
+            future.set_result(None)
+
+    threading.Thread(target=task, daemon=True).start()
+    return future
+
+def probe_proxy_background(remote_base):
+    """Connects to the proxy while the cache is checked. The returned future resolves to the prewarm result."""
+    probe = Future()
+    def task():
+        try: probe.set_result(connection_pool.prewarm(remote_base, timeout=3.0))
+        except Exception: probe.set_result(True)
 
     threading.Thread(target=task, daemon=True).start()
+    return probe
 
 def process_and_execute(incoming_args):
     try:
@@ -204,92 +340,138 @@ def process_and_execute(incoming_args):
         if custom_base and "whyknot.dev" not in custom_base:
             REMOTE_BASE = custom_base.rstrip("/")
         else:
-            sub = "test." if CONFIG.get("domain_branch", "stable") == "test" else ""
+            sub = "test." if CONFIG["domain_branch"] == "test" else ""
             REMOTE_BASE = f"https://{sub}whyknot.dev"
 
-        custom_ua = CONFIG.get("custom_user_agent")
-        is_legacy = detect_legacy(incoming_args, custom_ua); player_hint = "unity" if is_legacy else "avpro"
+        # CONFIG is merged with DEFAULT_CONFIG, so every key is present
+        custom_ua = CONFIG["custom_user_agent"]
+        tier1_enabled, tier4_enabled = CONFIG["enable_tier1_proxy"], CONFIG["enable_tier4_recovery"]
+        state = read_wrapper_state()
+        is_legacy = detect_legacy(incoming_args, state); player_hint = "unity" if is_legacy else "avpro"
 
         logger.info(f"Request: {target_url[:70]}... [{player_hint.upper()}]")
+        # Only a history hit does network work worth overlapping the proxy connect with
+        has_history = bool(state) and any(h[0] == target_url and time.time() - h[3] < 3600 for h in state.get('history', []))
+        proxy_down = proxy_known_down(state, REMOTE_BASE)
+        proxy_probe = probe_proxy_background(REMOTE_BASE) if tier1_enabled and has_history and not proxy_down else None
         
-        # Start background format listing if in debug mode
-        if CONFIG.get("debug_mode"):
-            if os.path.exists(LATEST_YTDLP_PATH):
-                list_formats_background(LATEST_YTDLP_PATH, "Modern", target_url)
-            if os.path.exists(ORIGINAL_YTDLP_PATH):
-                list_formats_background(ORIGINAL_YTDLP_PATH, "Native", target_url)
-
-        cached = get_cached_result(target_url)
+        cached = get_cached_result(target_url, state)
         if cached: 
             safe_print(cached)
             logger.info(f"Resolution successful via Cache in {time.time() - start_time:.2f}s.")
             return 0
 
-        # TIER 1: PROXY (Fastest)
-        if CONFIG.get("enable_tier1_proxy", True):
-            t1_start = time.time()
-            logger.info("Checking Tier 1 (Proxy)...")
-            res = resolve_tier_1_proxy(target_url, incoming_args, 10.0, custom_ua, REMOTE_BASE, player_hint)
+        # Start background format listing if in debug mode. Only once the cache missed: on a hit the
+        # two extra yt-dlp spawns would compete with the history HEAD and be killed at exit unused.
+        if CONFIG["debug_mode"]:
+            if LATEST_YTDLP_PATH in PRESENT_BINARIES:
+                list_formats_background(LATEST_YTDLP_PATH, "Modern", target_url)
+            if ORIGINAL_YTDLP_PATH in PRESENT_BINARIES:
+                list_formats_background(ORIGINAL_YTDLP_PATH, "Native", target_url)
+
+        def tier_1():
+            res = resolve_tier_1_proxy(target_url, incoming_args, (3.0, 10.0), custom_ua, REMOTE_BASE, player_hint)
             if res and res.get('url'):
-                if verify_stream(res['url'], timeout=5.0, user_agent=custom_ua):
-                    elapsed = time.time() - start_time
-                    logger.info(f"Tier 1 VALIDATED in {time.time() - t1_start:.2f}s. (Total: {elapsed:.2f}s)")
-                    update_wrapper_success(target_url, res['url'], 1)
-                    safe_print(res['url']); return 0
+                # The proxy already resolved it; a direct media file is accepted without another round trip
+                if CONFIG["trust_direct_video_url"] and is_direct_video_url(res['url']): return res['url'], " (Direct)"
+                if verify_stream(res['url'], timeout=5.0, user_agent=custom_ua): return res['url'], ""
                 logger.debug("Tier 1 failed verification.")
+            return None
 
-        # TIER 2: MODERN (yt-dlp latest)
-        if CONFIG.get("enable_tier2_modern", True):
-            t2_start = time.time()
-            logger.info("Checking Tier 2 (Modern)...")
-            res = resolve_tier_2_modern(incoming_args, 30.0, custom_ua, APP_BASE_PATH, LATEST_YTDLP_PATH, LATEST_YTDLP_FILENAME, CONFIG.get("preferred_max_height", 1080), is_legacy)
+        def verify_extracted(url, ytdlp_path):
+            """Returns the log suffix for a verified yt-dlp result, or None if it failed."""
+            # The binary just extracted this URL, so re-running it on the page proves nothing a network check doesn't.
+            # A video+audio selection prints one URL per line, and each one is checked on its own.
+            lines = [line.strip() for line in url.splitlines() if line.strip()]
+            if lines and all(line.startswith(('http://', 'https://')) for line in lines):
+                return " (Network)" if all(verify_stream(line, timeout=5.0, user_agent=custom_ua) for line in lines) else None
+            return "" if verify_stream_with_ytdlp(ytdlp_path, target_url, timeout=15.0) is True else None
+
+        def tier_2():
+            res = resolve_tier_2_modern(incoming_args, 30.0, custom_ua, APP_BASE_PATH, LATEST_YTDLP_PATH, LATEST_YTDLP_FILENAME, CONFIG["_tier2_format_legacy" if is_legacy else "_tier2_format_modern"])
             if res and res.get('url'):
-                v_res = verify_stream_with_ytdlp(LATEST_YTDLP_PATH, target_url, timeout=15.0)
-                if v_res is True:
-                    elapsed = time.time() - start_time
-                    logger.info(f"Tier 2 VALIDATED in {time.time() - t2_start:.2f}s. (Total: {elapsed:.2f}s)")
-                    update_wrapper_success(target_url, res['url'], 2); safe_print(res['url']); return 0
-                elif v_res is None:
-                    if verify_stream(res['url'], timeout=5.0, user_agent=custom_ua):
-                        elapsed = time.time() - start_time
-                        logger.info(f"Tier 2 VALIDATED (Network) in {time.time() - t2_start:.2f}s. (Total: {elapsed:.2f}s)")
-                        update_wrapper_success(target_url, res['url'], 2); safe_print(res['url']); return 0
+                via = verify_extracted(res['url'], LATEST_YTDLP_PATH)
+                if via is not None: return res['url'], via
                 logger.debug("Tier 2 failed verification.")
+            return None
 
-        # TIER 3: NATIVE (yt-dlp original)
-        if CONFIG.get("enable_tier3_native", True):
-            t3_start = time.time()
-            logger.info("Checking Tier 3 (Native)...")
+        def tier_3():
             res = resolve_tier_3_native(incoming_args, 15.0, APP_BASE_PATH, ORIGINAL_YTDLP_PATH, ORIGINAL_YTDLP_FILENAME)
             if res and res.get('url'):
-                v_res = verify_stream_with_ytdlp(ORIGINAL_YTDLP_PATH, target_url, timeout=15.0)
-                if v_res is True:
-                    elapsed = time.time() - start_time
-                    logger.info(f"Tier 3 VALIDATED in {time.time() - t3_start:.2f}s. (Total: {elapsed:.2f}s)")
-                    update_wrapper_success(target_url, res['url'], 3); safe_print(res['url']); return 0
-                elif v_res is None:
-                    if verify_stream(res['url'], timeout=5.0, user_agent=custom_ua):
-                        elapsed = time.time() - start_time
-                        logger.info(f"Tier 3 VALIDATED (Network) in {time.time() - t3_start:.2f}s. (Total: {elapsed:.2f}s)")
-                        update_wrapper_success(target_url, res['url'], 3); safe_print(res['url']); return 0
+                via = verify_extracted(res['url'], ORIGINAL_YTDLP_PATH)
+                if via is not None: return res['url'], via
                 logger.debug("Tier 3 failed verification.")
+            return None
+
+        def finish(result, tier, t_start):
+            url, via = result
+            elapsed = time.time() - start_time
+            logger.info(f"Tier {tier} VALIDATED{via} in {time.time() - t_start:.2f}s. (Total: {elapsed:.2f}s)")
+            # VRChat only needs stdout; the history write happens after the URL is out
+            safe_print(url); update_wrapper_success(target_url, url, tier, state); return 0
+
+        # Proxy reachability decides whether Tier 1 runs at all. proxy_up is False when the host refused
+        # or did not resolve, and None when the probe only timed out, which Tier 4's longer retry may outlast.
+        proxy_up = True
+        if tier1_enabled:
+            if proxy_down: proxy_up = False
+            else:
+                proxy_up = proxy_probe.result() if proxy_probe else connection_pool.prewarm(REMOTE_BASE, timeout=3.0)
+                if proxy_up is False: remember_proxy_down(REMOTE_BASE)
+
+        # TIER 1 -> 3: each tier starts when the one before it fails or overruns its grace window.
+        # A lower tier keeps running after the next one is hedged in, and the first validated URL wins.
+        tiers = []
+        if not proxy_up:
+            logger.info(f"Skipping Tier 1 (Proxy): Server {'unreachable' if proxy_up is False else 'did not answer the probe'}.")
+        elif tier1_enabled:
+            tiers.append((1, "Proxy", tier_1, CONFIG["tier1_grace_ms"]))
+        if CONFIG["enable_tier2_modern"]:
+            tiers.append((2, "Modern", tier_2, CONFIG["tier2_grace_ms"]))
+        if CONFIG["enable_tier3_native"]:
+            tiers.append((3, "Native", tier_3, None))
+
+        running = {}; hedge_at = None; newest = None
+        while tiers or running:
+            if tiers and (not running or time.time() >= hedge_at):
+                tier, name, fn, grace_ms = tiers.pop(0)
+                logger.info(f"Checking Tier {tier} ({name}){' alongside slower tier' if running else ''}...")
+                newest = run_in_background(fn)
+                running[newest] = (tier, time.time())
+                hedge_at = time.time() + grace_ms / 1000.0 if grace_ms is not None else None
+            timeout = max(0.0, hedge_at - time.time()) if tiers and hedge_at is not None else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            # Prefer the lower tier when several finish in the same wakeup
+            for future in sorted(done, key=lambda f: running[f][0]):
+                tier, t_start = running.pop(future)
+                result = future.result()
+                if result: return finish(result, tier, t_start)
+                # The newest tier failed, so the next one starts now instead of after its grace window
+                if future is newest: hedge_at = time.time()
 
         # TIER 4: RECOVERY PROXY
-        if CONFIG.get("enable_tier4_recovery", True):
+        if tier4_enabled and proxy_up is False:
+            logger.info("Skipping Tier 4 (Recovery): Server unreachable.")
+        elif tier4_enabled and proxy_retry_is_futile(target_url, incoming_args, custom_ua, REMOTE_BASE, player_hint):
+            logger.info("Skipping Tier 4 (Recovery): Proxy already rejected or refused this exact request.")
+        elif tier4_enabled:
             logger.warning("Emergency Tier 4 (Recovery)...")
-            res = resolve_tier_1_proxy(target_url, incoming_args, 15.0, custom_ua, REMOTE_BASE, player_hint)
+            res = resolve_tier_1_proxy(target_url, incoming_args, (3.0, 15.0), custom_ua, REMOTE_BASE, player_hint)
             if res and res.get('url') and verify_stream(res['url'], timeout=8.0, user_agent=custom_ua):
                 elapsed = time.time() - start_time
                 logger.info(f"Tier 4 SUCCESS. (Total: {elapsed:.2f}s)")
-                update_wrapper_success(target_url, res['url'], 4)
-                safe_print(res['url']); return 0
+                safe_print(res['url'])
+                update_wrapper_success(target_url, res['url'], 4, state); return 0
 
         logger.error(f"FATAL: All resolution tiers failed for: {target_url}")
+        if has_history: forget_history(target_url)
         return 1
     except Exception as e:
         import traceback; logger.error(f"FATAL: {e}\n{traceback.format_exc()}")
         return 1
-    finally: job_manager.close()
+    finally:
+        job_manager.close()
+        connection_pool.close()
 
 def main():
     try:
@@ -300,7 +482,8 @@ def main():
         overrides = CONFIG.get("_overrides")
         if overrides:
             logger.info(f"Config Overrides: {', '.join(overrides)}")
-            
+        
+        warmup_executables()
         sys.exit(process_and_execute(sys.argv[1:]))
     except Exception as e:
         sys.stderr.write(f"FATAL MAIN: {e}\n"); sys.exit(1)
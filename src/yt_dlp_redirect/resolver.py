@@ -1,22 +1,29 @@
 import os
 import logging
 import subprocess
-import platform
-import json
 import time
 import re
-import urllib.request
+from functools import lru_cache
 from urllib.parse import quote_plus
 
 try:
-    from jobs import job_manager
+    from jobs import job_manager, CREATION_FLAGS
     from verifier import verify_stream, verify_stream_with_ytdlp
+    from connections import connection_pool, UNREACHABLE_ERRORS
+    from json_codec import json_loads
 except ImportError:
-    from .jobs import job_manager
+    from .jobs import job_manager, CREATION_FLAGS
     from .verifier import verify_stream, verify_stream_with_ytdlp
+    from .connections import connection_pool, UNREACHABLE_ERRORS
+    from .json_codec import json_loads
 
 logger = logging.getLogger("Resolver")
 
+# (request_hash, answered) for the most recent proxy call. 'answered' is True when the
+# server responded without a usable URL, or could not be reached at all (refused / DNS),
+# meaning an identical retry cannot do better.
+LAST_PROXY_ATTEMPT = None
+
 def get_speed_flags(executable_path):
     """Returns a list of flags optimized for speed based on version-safe detection."""
     is_og = "og" in executable_path.lower()
@@ -42,15 +49,26 @@ def get_speed_flags(executable_path):
         "--no-video-multistreams"
     ]
 
+@lru_cache(maxsize=None)
+def get_child_env(app_base_path):
+    """Builds the subprocess environment (private temp dir) once; every tier spawn reuses it."""
+    env = os.environ.copy()
+    temp_dir = os.path.join(app_base_path, "_tmp")
+    os.makedirs(temp_dir, exist_ok=True)
+    env['TMP'] = temp_dir
+    env['TEMP'] = temp_dir
+    return env
+
+@lru_cache(maxsize=None)
+def find_deno(app_base_path):
+    """Looks for the bundled deno.exe once per invocation."""
+    deno_path = os.path.join(app_base_path, "deno.exe")
+    return deno_path if os.path.exists(deno_path) else None
+
 def attempt_executable(path, executable_name, args, app_base_path, timeout=10.0):
-    if not os.path.exists(path): return None, 1
     try:
         # 1. Prepare Environment
-        env = os.environ.copy()
-        temp_dir = os.path.join(app_base_path, "_tmp")
-        if not os.path.exists(temp_dir): os.makedirs(temp_dir)
-        env['TMP'] = temp_dir
-        env['TEMP'] = temp_dir
+        env = get_child_env(app_base_path)
         
         # 2. Inject Speed-Up Flags
         speed_flags = get_speed_flags(path)
@@ -60,69 +78,86 @@ def attempt_executable(path, executable_name, args, app_base_path, timeout=10.0)
                 final_args.insert(0, flag)
         
         cmd = [path] + final_args
-        logger.debug(f"Executing: {' '.join(cmd)}")
+        if logger.isEnabledFor(logging.DEBUG): logger.debug("Executing: %s", ' '.join(cmd))
         
         # 3. High-Precision Launch Timing
         launch_start = time.perf_counter()
         
+        # Stderr is only ever logged at DEBUG; without a second pipe communicate() needs one drain thread, not two
+        capture_stderr = logger.isEnabledFor(logging.DEBUG)
         process = subprocess.Popen(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=env,
-            creationflags=subprocess.CREATE_NO_WINDOW if platform.system() == 'Windows' else 0
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE if capture_stderr else subprocess.DEVNULL, env=env,
+            creationflags=CREATION_FLAGS
         )
         job_manager.assign(process)
         
         try:
-            stdout, stderr = process.communicate(timeout=timeout)
+            raw_out, raw_err = process.communicate(timeout=timeout)
+            stdout = raw_out.decode('utf-8', errors='replace')
             elapsed = time.perf_counter() - launch_start
             
             # Log exact launch/resolve time in debug as requested
-            logger.debug(f"[{executable_name}] Resolution took {elapsed:.3f}s")
+            logger.debug("[%s] Resolution took %.3fs", executable_name, elapsed)
             
             if process.returncode == 0: return stdout.strip(), 0
             
-            logger.debug(f"Process {executable_name} FAILED (Code {process.returncode}). Stderr: {stderr.strip()}")
+            if capture_stderr:
+                logger.debug("Process %s FAILED (Code %s). Stderr: %s", executable_name, process.returncode, raw_err.decode('utf-8', errors='replace').strip())
             return None, process.returncode
         except subprocess.TimeoutExpired:
-            process.kill()
-            logger.debug(f"Process {executable_name} TIMED OUT.")
+            job_manager.kill_tree(process)
+            logger.debug("Process %s TIMED OUT.", executable_name)
             return None, -1
+    except FileNotFoundError:
+        # Popen reports a missing binary itself, so there is no separate exists() check per spawn
+        return None, 1
     except Exception as e: 
-        logger.debug(f"Error attempting executable {executable_name}: {e}")
+        logger.debug("Error attempting executable %s: %s", executable_name, e)
         return None, 1
 
-from verifier import ssl_context
+def build_proxy_resolve_url(target_url, incoming_args, remote_server_base, player_hint):
+    video_type = "va"
+    for i, arg in enumerate(incoming_args):
+        if arg == "--format" and i + 1 < len(incoming_args):
+            if "bestaudio" in incoming_args[i+1]: video_type = "a"
+            break
+    return f"{remote_server_base}/api/stream/resolve?url={quote_plus(target_url)}&video_type={video_type}&player={player_hint}"
 
 def resolve_via_proxy(target_url, incoming_args, res_timeout, custom_ua, remote_server_base, player_hint):
+    global LAST_PROXY_ATTEMPT
     try:
-        video_type = "va"
-        for i, arg in enumerate(incoming_args):
-            if arg == "--format" and i + 1 < len(incoming_args):
-                if "bestaudio" in incoming_args[i+1]: video_type = "a"
-                break
-        
-        resolve_url = f"{remote_server_base}/api/stream/resolve?url={quote_plus(target_url)}&video_type={video_type}&player={player_hint}"
-        logger.debug(f"Proxy Request: {resolve_url}")
-        req = urllib.request.Request(resolve_url, method='GET')
-        if custom_ua: req.add_header("User-Agent", custom_ua)
+        resolve_url = build_proxy_resolve_url(target_url, incoming_args, remote_server_base, player_hint)
+        logger.debug("Proxy Request: %s", resolve_url)
+        request_hash = hash((resolve_url, custom_ua))
+        headers = {"User-Agent": custom_ua} if custom_ua else {}
         
-        with urllib.request.urlopen(req, timeout=res_timeout, context=ssl_context) as response:
-            if response.status == 200:
-                body = response.read().decode()
-                if body.strip().startswith("<!DOCTYPE") or "<html" in body.lower():
-                    logger.debug("Proxy returned HTML instead of JSON (likely Smart Routing page).")
-                    return None
-                
-                try:
-                    data = json.loads(body)
-                    url = data.get("stream_url") or data.get("url")
-                    if url: return url
-                    logger.debug("Proxy result missing URL field.")
-                except json.JSONDecodeError:
-                    logger.debug(f"Failed to decode proxy JSON. Body starts with: {body[:50]}")
-            else:
-                logger.debug(f"Proxy returned HTTP {response.status}")
+        LAST_PROXY_ATTEMPT = (request_hash, False)
+        status, _, raw = connection_pool.request('GET', resolve_url, headers=headers, timeout=res_timeout)
+        # 4xx is a definitive rejection; 5xx may be transient
+        LAST_PROXY_ATTEMPT = (request_hash, status < 500)
+        if status == 200:
+            # Sniff and parse the raw bytes; no str copy of the body is made on the success path
+            if raw.lstrip().startswith(b"<!DOCTYPE") or b"<html" in raw.lower():
+                logger.debug("Proxy returned HTML instead of JSON (likely Smart Routing page).")
+                return None
+            
+            try:
+                data = json_loads(raw)
+                url = data.get("stream_url") or data.get("url")
+                if url:
+                    LAST_PROXY_ATTEMPT = (request_hash, False)
+                    return url
+                logger.debug("Proxy result missing URL field.")
+            except ValueError:
+                logger.debug("Failed to decode proxy JSON. Body starts with: %s", raw[:50])
+        else:
+            logger.debug("Proxy returned HTTP %s", status)
+    except UNREACHABLE_ERRORS as e:
+        # The host is down or unresolvable, unlike a timeout which a longer retry might outlast
+        LAST_PROXY_ATTEMPT = (request_hash, True)
+        logger.debug("Proxy unreachable: %s", e)
     except Exception as e:
-        logger.debug(f"Proxy connection failed: {e}")
+        logger.debug("Proxy connection failed: %s", e)
     return None
 
 def resolve_tier_1_proxy(target_url, incoming_args, res_timeout, custom_ua, remote_base, player_hint):
@@ -132,28 +167,37 @@ def resolve_tier_1_proxy(target_url, incoming_args, res_timeout, custom_ua, remo
         return {"tier": 1, "url": url}
     return None
 
-def resolve_tier_2_modern(incoming_args, res_timeout, custom_ua, app_base_path, latest_path, latest_filename, max_height, is_legacy):
+def proxy_retry_is_futile(target_url, incoming_args, custom_ua, remote_base, player_hint):
+    """True if the last proxy call was this exact request and the server definitively answered without a URL or refused the connection."""
+    if not LAST_PROXY_ATTEMPT: return False
+    resolve_url = build_proxy_resolve_url(target_url, incoming_args, remote_base, player_hint)
+    request_hash, answered = LAST_PROXY_ATTEMPT
+    return answered and request_hash == hash((resolve_url, custom_ua))
+
+def build_modern_formats(max_height):
+    """Returns the (legacy, modern) Tier 2 format selectors for a height cap. Built once at config load."""
+    # Standard legacy format with optional metadata checks
+    legacy = f"best[height<=?{max_height}][ext=mp4][vcodec^=avc1][acodec^=mp4a][protocol^=http][protocol!*=m3u8][protocol!*=dash]/best[height<=?{max_height}]/best"
+    # High-performance modern format selection with optional (?) height for audio-only support
+    modern = f"(bestvideo[height<=?{max_height}]+bestaudio)/best[height<=?{max_height}]/best"
+    return legacy, modern
+
+def resolve_tier_2_modern(incoming_args, res_timeout, custom_ua, app_base_path, latest_path, latest_filename, format_selector):
     """Tier 2: Modern yt-dlp."""
-    args = list(incoming_args)
-    # Remove old format if present
-    if "-f" in args: 
-        idx = args.index("-f")
-        args.pop(idx); args.pop(idx)
-    elif "--format" in args:
-        idx = args.index("--format")
-        args.pop(idx); args.pop(idx)
+    # Single pass: drop the incoming format (flag + value), we supply our own
+    args = []
+    skip_next = False
+    for arg in incoming_args:
+        if skip_next: skip_next = False; continue
+        if arg in ("-f", "--format"): skip_next = True; continue
+        args.append(arg)
 
-    deno_path = os.path.join(app_base_path, "deno.exe")
+    deno_path = find_deno(app_base_path)
     args.extend(["--remote-components", "ejs:github"])
-    if os.path.exists(deno_path):
+    if deno_path:
         args.extend(["--extractor-args", f"ejs:deno_path={deno_path}"])
 
-    if is_legacy:
-        # Standard legacy format with optional metadata checks
-        args.extend(["-f", f"best[height<=?{max_height}][ext=mp4][vcodec^=avc1][acodec^=mp4a][protocol^=http][protocol!*=m3u8][protocol!*=dash]/best[height<=?{max_height}]/best"])
-    else:
-        # High-performance modern format selection with optional (?) height for audio-only support
-        args.extend(["-f", f"(bestvideo[height<=?{max_height}]+bestaudio)/best[height<=?{max_height}]/best"])
+    args.extend(["-f", format_selector])
 
     res, code = attempt_executable(latest_path, latest_filename, args, app_base_path, timeout=res_timeout)
     if code == 0 and res:
@@ -1,89 +1,95 @@
 import os
 import logging
-import urllib.request
-import urllib.error
 import subprocess
-import ssl
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlsplit
 
 try:
-    from jobs import job_manager
+    from jobs import job_manager, CREATION_FLAGS
+    from connections import connection_pool
 except ImportError:
-    from .jobs import job_manager
+    from .jobs import job_manager, CREATION_FLAGS
+    from .connections import connection_pool
 
 logger = logging.getLogger("Verifier")
 
-# Global context for SSL to avoid some certificate issues
-ssl_context = ssl.create_default_context()
-ssl_context.check_hostname = False
-ssl_context.verify_mode = ssl.CERT_NONE
+# Built once; only a custom User-Agent needs a per-call copy
+VERIFY_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "*/*",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Connection": "keep-alive"
+}
+
+# Hosts that answered HEAD with 403/405 this run; later hops to them (manifest variants) go straight to GET
+HEAD_REJECTING_HOSTS = set()
 
 def verify_stream(url, timeout=5.0, depth=0, user_agent=None):
     """
     Verifies if a URL is actually a playable stream (not HTML/404).
-    Uses a stealthy HEAD request followed by a recursive check for manifests.
+    Uses a stealthy HEAD request followed by a check of the first variant for master manifests.
     """
-    if not url or depth > 3: return False
+    if not url: return False
     
-    ua = user_agent or "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    headers = {
-        "User-Agent": ua,
-        "Accept": "*/*",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Connection": "keep-alive"
-    }
+    headers = dict(VERIFY_HEADERS, **{"User-Agent": user_agent}) if user_agent else VERIFY_HEADERS
     
     try:
-        # 1. Initial HEAD check (Stealthy)
-        req = urllib.request.Request(url, method='HEAD', headers=headers)
-        try:
-            with urllib.request.urlopen(req, timeout=timeout, context=ssl_context) as resp:
-                status = resp.getcode()
-                content_type = resp.headers.get('Content-Type', '').lower()
+        # Nested manifests are followed in a loop, so the hop limit is a counter rather than stack depth
+        while depth <= 3:
+            # 1. Initial HEAD check (Stealthy). Requests go through the shared pool, so a proxied
+            # stream on the same host as the resolve call reuses its connection.
+            host = urlsplit(url).netloc
+            if host in HEAD_REJECTING_HOSTS:
+                logger.debug("[Verifier] %s rejects HEAD, using GET Range directly.", host)
+            else:
+                status, resp_headers, _ = connection_pool.request('HEAD', url, headers=headers, timeout=timeout)
+                if status >= 400:
+                    # Some CDNs return 403 or 405 for HEAD. We fallback to GET.
+                    if status not in [403, 405]:
+                        logger.debug("HEAD check failed: HTTP %s", status)
+                        return False
+                    HEAD_REJECTING_HOSTS.add(host)
+                    logger.debug("[Verifier] HEAD returned %s, using GET Range fallback.", status)
+                else:
+                    content_type = (resp_headers.get('Content-Type') or '').lower()
+            
+                    logger.debug("[Verifier] HEAD %s - Type: %s", status, content_type)
+
+                    # If it's a direct video/audio type, we're likely good
+                    if any(x in content_type for x in ['video/', 'audio/', 'application/octet-stream', 'mpegurl', 'application/dash+xml']):
+                        return True
                 
-                logger.debug(f"[Verifier] HEAD {status} - Type: {content_type}")
+                    # If it's HTML, it's almost certainly a fail (login page, 404 page, etc.)
+                    if 'text/html' in content_type:
+                        logger.debug("Stream verification rejected: Content-Type is HTML.")
+                        return False
 
-                # If it's a direct video/audio type, we're likely good
-                if any(x in content_type for x in ['video/', 'audio/', 'application/octet-stream', 'mpegurl', 'application/dash+xml']):
-                    return True
-                    
-                # If it's HTML, it's almost certainly a fail (login page, 404 page, etc.)
-                if 'text/html' in content_type:
-                    logger.debug(f"Stream verification rejected: Content-Type is HTML.")
-                    return False
-        except urllib.error.HTTPError as e:
-            # Some CDNs return 403 or 405 for HEAD. We fallback to GET.
-            if e.code not in [403, 405]:
-                logger.debug(f"HEAD check failed: HTTP {e.code}")
+            # 2. Manifest/Stream Deep Check (GET)
+            status, _, raw = connection_pool.request('GET', url, headers=dict(headers, Range='bytes=0-8192'), timeout=timeout, max_bytes=8192)
+            if status >= 400:
+                logger.debug("GET check failed: HTTP %s", status)
                 return False
-            logger.debug(f"[Verifier] HEAD returned {e.code}, using GET Range fallback.")
-
-        # 2. Manifest/Stream Deep Check (GET)
-        req_get = urllib.request.Request(url, method='GET', headers=headers)
-        req_get.add_header('Range', 'bytes=0-8192')
+            # Checked as bytes: a segment or media playlist never needs decoding into a str
+            content_upper = raw.strip().upper()
         
-        with urllib.request.urlopen(req_get, timeout=timeout, context=ssl_context) as resp:
-            content = resp.read(8192).decode('utf-8', errors='ignore').strip()
-            content_upper = content.upper()
-            
             # Signature checks
-            if content_upper.startswith('#EXTM3U') or '<MPD' in content_upper or '<?XML' in content_upper:
-                if '#EXT-X-STREAM-INF' in content_upper:
-                    # Master playlist - check first variant
-                    lines = [line.strip() for line in content.split('\n') if line.strip() and not line.startswith('#')]
-                    if lines:
-                        for line in lines:
-                            if not line.startswith('#'):
-                                next_url = urljoin(url, line)
-                                return verify_stream(next_url, timeout, depth + 1, ua)
+            if content_upper.startswith(b'#EXTM3U') or b'<MPD' in content_upper or b'<?XML' in content_upper:
+                if b'#EXT-X-STREAM-INF' in content_upper:
+                    # Master playlist - check first variant, stopping at the first URI line
+                    for line in raw.splitlines():
+                        line = line.strip()
+                        if line and not line.startswith(b'#'): break
+                    else: return True
+                    url = urljoin(url, line.decode('utf-8', errors='ignore')); depth += 1
+                    continue
                 return True
-                
+            
             # If it's not a manifest but we got data and it's not HTML, consider it verified
-            if len(content) > 0 and '<HTML' not in content_upper and '<!DOCTYPE' not in content_upper:
+            if content_upper and b'<HTML' not in content_upper and b'<!DOCTYPE' not in content_upper:
                 return True
+            return False
 
     except Exception as e: 
-        logger.debug(f"Verification Exception: {e}")
+        logger.debug("Verification Exception: %s", e)
     
     return False
 
@@ -92,7 +98,6 @@ def verify_stream_with_ytdlp(ytdlp_path, url, timeout=15.0):
     Uses the actual yt-dlp binary to verify if a URL is playable.
     Returns: True (Success), False (Failed), None (Binary doesn't support validation flags)
     """
-    if not os.path.exists(ytdlp_path): return False
     try:
         # Use --get-url as it implies --simulate and is widely supported
         cmd = [ytdlp_path, "--get-url", url]
@@ -101,10 +106,10 @@ def verify_stream_with_ytdlp(ytdlp_path, url, timeout=15.0):
         if "latest" in ytdlp_path.lower():
             cmd = [ytdlp_path, "--no-warnings", "--ignore-errors", "--get-url", url]
 
-        logger.debug(f"Running binary verification: {' '.join(cmd)}")
+        if logger.isEnabledFor(logging.DEBUG): logger.debug("Running binary verification: %s", ' '.join(cmd))
         process = subprocess.Popen(
             cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-            creationflags=subprocess.CREATE_NO_WINDOW
+            creationflags=CREATION_FLAGS
         )
         job_manager.assign(process)
         try:
@@ -116,14 +121,14 @@ def verify_stream_with_ytdlp(ytdlp_path, url, timeout=15.0):
             
             # If binary doesn't support --get-url (very unlikely), fallback
             if "no such option" in err_text and "--get-url" in err_text:
-                logger.debug(f"[Verifier] Binary {os.path.basename(ytdlp_path)} doesn't support --get-url.")
+                logger.debug("[Verifier] Binary %s doesn't support --get-url.", os.path.basename(ytdlp_path))
                 return None
                 
-            logger.debug(f"[Verifier] Binary check failed ({process.returncode}): {err_text.strip()}")
+            logger.debug("[Verifier] Binary check failed (%s): %s", process.returncode, err_text.strip())
             return False
         except subprocess.TimeoutExpired:
-            process.kill()
+            job_manager.kill_tree(process)
             return False
     except Exception as e: 
-        logger.debug(f"Binary check exception: {e}")
+        logger.debug("Binary check exception: %s", e)
         return False